@@ -8,15 +8,22 @@ Run:
   python organizer.py --once
 """
 
+import errno
 import os
 import shutil
+import stat
 import time
 import re
 import json
 import logging
+import logging.handlers
 import argparse
+import atexit
+import queue
 import threading
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from functools import lru_cache
 
 # Optional import: watchdog
 try:
@@ -26,7 +33,33 @@ try:
 except Exception:
     WATCHDOG_AVAILABLE = False
 
+# Optional import: numpy (only used for very large one-shot runs)
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except Exception:
+    NUMPY_AVAILABLE = False
+
+# set on Ctrl-C so pooled workers stop polling instead of keeping the
+# process alive until their stability timeouts expire
+_shutdown = threading.Event()
+
 # ---------- Utilities ----------
+class _MultiPattern:
+    """search() across individually compiled patterns; fallback for exclude
+    lists that can't be merged into one alternation (e.g. patterns using
+    global flags like (?i))."""
+
+    def __init__(self, patterns):
+        self._patterns = patterns
+
+    def search(self, s):
+        for p in self._patterns:
+            m = p.search(s)
+            if m:
+                return m
+        return None
+
 def load_config(path="config.json"):
     # default config
     default = {
@@ -51,111 +84,254 @@ def load_config(path="config.json"):
         "dry_run": False,
         "wait_for_stable_seconds": 1,
         "stable_checks": 3,
+        "max_workers": 8,
         "log_file": "organizer.log"
     }
     if os.path.exists(path):
         with open(path, "r", encoding="utf-8") as f:
             user = json.load(f)
             default.update(user)
+    # logging isn't configured yet here, so stash complaints about bad
+    # patterns for main to emit after setup_logging
+    config_warnings = []
+    # precompile regex patterns once so hot paths skip re's cache lookup
+    compiled_rules = []
+    for r in default["regex_rules"]:
+        try:
+            compiled_rules.append({"re": re.compile(r["pattern"], re.IGNORECASE),
+                                   "folder": r["folder"]})
+        except re.error:
+            config_warnings.append("Invalid regex rule skipped: %s" % r.get("pattern"))
+    default["regex_rules"] = compiled_rules
+    default["_rules_lock"] = threading.Lock()
+    # every top-level folder this tool can move files into: categories,
+    # regex-rule targets, and the fallback
+    default["_organized_names"] = (set(default["file_types"]) | {"Others"}
+                                   | {r["folder"] for r in compiled_rules})
+    # device of watch_dir and prefixes of the folders we organize into;
+    # filled in by main once the dir is validated
+    default["_watch_dev"] = None
+    default["_organized_prefixes"] = ()
+    compiled_excludes = []
+    for pat in default["exclude_patterns"]:
+        try:
+            re.compile(pat)
+            compiled_excludes.append(pat)
+        except re.error:
+            config_warnings.append("Invalid exclude pattern skipped: %s" % pat)
+    default["exclude_patterns"] = compiled_excludes
+    default["_config_warnings"] = config_warnings
+    # one alternation scans all exclude patterns in a single pass
+    if compiled_excludes:
+        try:
+            default["_exclude_re"] = re.compile("|".join(f"(?:{p})" for p in compiled_excludes))
+        except re.error:
+            # a pattern valid on its own can break the merged form
+            default["_exclude_re"] = _MultiPattern([re.compile(p) for p in compiled_excludes])
+    else:
+        default["_exclude_re"] = None
+    # inverted extension index: one dict lookup per file instead of a
+    # linear scan over every category's extension list
+    default["_ext_index"] = {e.lower(): folder
+                             for folder, exts in default["file_types"].items()
+                             for e in exts}
+    # compound extensions (.tar.gz) need an endswith pre-check since a
+    # trailing-dot split only sees the last component
+    default["_compound_exts"] = tuple(e for e in default["_ext_index"]
+                                      if e.count(".") > 1)
+    default["_temp_ext_tuple"] = tuple(e.lower() for e in default["temp_extensions"])
+    default["_date_format"] = default["date_format"]
+    # lazy per-target-dir locks so concurrent workers serialize only on
+    # destination collision checks, not on each other
+    default["_dir_locks"] = {}
+    default["_dir_locks_guard"] = threading.Lock()
+    # target dirs we already created this run; saves a mkdir syscall per file
+    default["_mkdir_cache"] = set()
+    # per-target-dir sets of existing basenames, so collision probing is a
+    # set lookup instead of an os.path.exists stat per candidate
+    default["_dir_contents"] = {}
     return default
 
 def setup_logging(log_file):
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(asctime)s %(levelname)s: %(message)s",
-        handlers=[
-            logging.StreamHandler(),
-            logging.FileHandler(log_file, encoding="utf-8")
-        ]
-    )
-
-def is_temporary(filename, config):
-    lower = filename.lower()
-    for ext in config.get("temp_extensions", []):
-        if lower.endswith(ext):
-            return True
-    return False
-
-def wait_until_stable(path, wait_sec=1, checks=3, timeout=60):
-    """Return True when file size stable for `checks` checks. Waits up to timeout seconds."""
+    # move formatting + disk writes off the hot path: producers drop records
+    # on a lock-free queue and a single listener thread drains them, so pool
+    # workers never serialize on the file handler's lock
+    formatter = logging.Formatter("%(asctime)s %(levelname)s: %(message)s")
+    handlers = [
+        logging.StreamHandler(),
+        logging.FileHandler(log_file, encoding="utf-8", delay=True)
+    ]
+    for h in handlers:
+        h.setFormatter(formatter)
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, *handlers)
+    listener.start()
+    atexit.register(listener.stop)
+    root = logging.getLogger()
+    root.setLevel(logging.INFO)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    logging.raiseExceptions = False
+
+def should_skip(filename, config):
+    """Return a reason ('hidden', 'temporary', 'excluded') when the file
+    shouldn't be organized, else None. One pass over the name instead of
+    separate hidden/temp/exclude checks."""
+    if filename[:1] == ".":
+        return "hidden"
+    # endswith with a tuple is a single C-level call
+    if filename.lower().endswith(config["_temp_ext_tuple"]):
+        return "temporary"
+    exc = config["_exclude_re"]
+    if exc and exc.search(filename):
+        return "excluded"
+    return None
+
+def wait_until_stable(path, st=None, wait_sec=1, checks=3, timeout=60):
+    """Return the final stat result once file size is stable for `checks` checks.
+    Waits up to timeout seconds; returns None if the file vanished or never settled.
+    Polling backs off exponentially from a short initial delay up to wait_sec,
+    so files that are already stable resolve in well under a second."""
     start = time.time()
     stable = 0
-    try:
-        last_size = os.path.getsize(path)
-    except OSError:
-        return False
+    if st is None:
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+    last_size = st.st_size
+    delay = min(wait_sec, 0.05)
     while time.time() - start < timeout and stable < checks:
-        time.sleep(wait_sec)
+        if _shutdown.wait(delay):
+            return None
+        delay = min(delay * 1.5, wait_sec)
         try:
-            size = os.path.getsize(path)
+            st = os.stat(path)
         except OSError:
-            return False
-        if size == last_size:
+            return None
+        if st.st_size == last_size:
             stable += 1
         else:
             stable = 0
-            last_size = size
-    return stable >= checks
-
-def unique_destination(dst_path):
-    """If dst_path exists, append (1), (2), ... before extension."""
-    if not os.path.exists(dst_path):
-        return dst_path
-    base, ext = os.path.splitext(dst_path)
+            last_size = st.st_size
+    return st if stable >= checks else None
+
+def unique_destination(filename, existing):
+    """If filename is taken in the target dir, append (1), (2), ... before the
+    extension. Reserves the chosen name in `existing` so later files in the
+    same run see it."""
+    if filename not in existing:
+        existing.add(filename)
+        return filename
+    base, ext = os.path.splitext(filename)
     i = 1
     while True:
         candidate = f"{base} ({i}){ext}"
-        if not os.path.exists(candidate):
+        if candidate not in existing:
+            existing.add(candidate)
             return candidate
         i += 1
 
+def _copy_across_devices(file_path, destination, st):
+    """Cross-device move: copy via the kernel (copy_file_range) where
+    available, else a large-buffer userspace copy; preserve mtime, then
+    unlink the source."""
+    with open(file_path, "rb") as fsrc, open(destination, "wb") as fdst:
+        remaining = st.st_size
+        if hasattr(os, "copy_file_range"):
+            try:
+                while remaining > 0:
+                    copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), remaining)
+                    if copied == 0:
+                        break
+                    remaining -= copied
+            except OSError:
+                # filesystem pair doesn't support it; file offsets are wherever
+                # the kernel left them, so the fallback picks up from there
+                pass
+        if remaining > 0:
+            shutil.copyfileobj(fsrc, fdst, 1024 * 1024)
+    os.utime(destination, ns=(st.st_atime_ns, st.st_mtime_ns))
+    os.remove(file_path)
+
+def _dir_lock(final_dir, config):
+    locks = config["_dir_locks"]
+    with config["_dir_locks_guard"]:
+        lock = locks.get(final_dir)
+        if lock is None:
+            lock = locks[final_dir] = threading.Lock()
+    return lock
+
 # ---------- Core move logic ----------
 def determine_target_folder(filename, config):
     fname = filename
-    # regex rules first (more specific)
-    for r in config.get("regex_rules", []):
-        try:
-            if re.search(r["pattern"], fname, re.IGNORECASE):
-                return r["folder"]
-        except Exception:
-            continue
-    # extension rules
-    ext = os.path.splitext(filename)[1].lower()
-    for folder, exts in config.get("file_types", {}).items():
-        if ext in [e.lower() for e in exts]:
-            return folder
-    return "Others"
-
-def date_subfolder(file_path, config):
-    if not config.get("date_based"):
+    # regex rules first (more specific); most configs have none, so skip
+    # the scan outright in that case
+    rules = config["regex_rules"]
+    if rules:
+        # the lock covers the scan too: a concurrent transposition mid-scan
+        # could otherwise make a reader skip a rule entirely
+        with config["_rules_lock"]:
+            for i, r in enumerate(rules):
+                if r["re"].search(fname):
+                    if i > 0:
+                        # transpose the hit one slot forward so frequently
+                        # matching rules drift to the front over a run
+                        rules[i - 1], rules[i] = rules[i], rules[i - 1]
+                    return r["folder"]
+    # extension rules; rpartition is a single C-level call vs. the
+    # platform-aware Python logic in os.path.splitext
+    lower = fname.lower()
+    compounds = config["_compound_exts"]
+    if compounds and lower.endswith(compounds):
+        for ce in compounds:
+            if lower.endswith(ce):
+                return config["_ext_index"][ce]
+    _, dot, ext = lower.rpartition(".")
+    if not dot:
+        return "Others"
+    return config["_ext_index"].get("." + ext, "Others")
+
+@lru_cache(maxsize=256)
+def _format_day(day_ordinal, fmt):
+    # bucketing to whole local calendar days keeps the cache tiny; the
+    # supported formats (%Y-%m, %Y-%m-%d) never need finer granularity
+    return date.fromordinal(day_ordinal).strftime(fmt)
+
+def date_subfolder(st, config):
+    if not config["date_based"]:
         return ""
-    field = config.get("date_field", "mtime")
-    if field == "ctime":
-        ts = os.path.getctime(file_path)
-    else:
-        ts = os.path.getmtime(file_path)
-    return datetime.fromtimestamp(ts).strftime(config.get("date_format", "%Y-%m"))
+    ts = st.st_ctime if config["date_field"] == "ctime" else st.st_mtime
+    return _format_day(datetime.fromtimestamp(ts).toordinal(), config["_date_format"])
 
-def move_file(file_path, config):
-    if not os.path.isfile(file_path):
-        return
+def move_file(file_path, config, st=None, skip_stability=False, target_folder=None):
     filename = os.path.basename(file_path)
-    if filename.startswith("."):
-        # ignore hidden files
-        logging.debug("Ignoring hidden file: %s", filename)
+    reason = should_skip(filename, config)
+    if reason is not None:
+        if reason == "hidden":
+            logging.debug("Ignoring hidden file: %s", filename)
+        else:
+            logging.info("Skipping %s file: %s", reason, filename)
         return
-    if is_temporary(filename, config):
-        logging.info("Skipping temporary file: %s", filename)
+    if st is None:
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            return
+    if not stat.S_ISREG(st.st_mode):
         return
 
-    # Wait until file is stable (not being written)
-    if not wait_until_stable(file_path, wait_sec=config.get("wait_for_stable_seconds",1),
-                             checks=config.get("stable_checks",3), timeout=300):
-        logging.warning("File not stable or accessible, skipping: %s", filename)
-        return
+    # Wait until file is stable (not being written); reuse the stat we have.
+    # Callers reacting to a close-write event already know the writer is done.
+    if not skip_stability:
+        st = wait_until_stable(file_path, st, wait_sec=config["wait_for_stable_seconds"],
+                               checks=config["stable_checks"], timeout=300)
+        if st is None:
+            logging.warning("File not stable or accessible, skipping: %s", filename)
+            return
 
-    target_folder = determine_target_folder(filename, config)
-    date_folder = date_subfolder(file_path, config)
+    if target_folder is None:
+        target_folder = determine_target_folder(filename, config)
+    date_folder = date_subfolder(st, config)
     watch_dir = config["watch_dir"]
 
     if date_folder:
@@ -163,60 +339,171 @@ def move_file(file_path, config):
     else:
         final_dir = os.path.join(watch_dir, target_folder)
 
-    os.makedirs(final_dir, exist_ok=True)
-    destination = os.path.join(final_dir, filename)
-    destination = unique_destination(destination)
+    # serialize collision check + rename per target dir so concurrent
+    # workers can't pick the same destination name
+    with _dir_lock(final_dir, config):
+        # the per-dir lock serializes this, and a rare duplicate makedirs
+        # from another dir's worker is harmless with exist_ok
+        if final_dir not in config["_mkdir_cache"]:
+            os.makedirs(final_dir, exist_ok=True)
+            config["_mkdir_cache"].add(final_dir)
+        existing = config["_dir_contents"].get(final_dir)
+        if existing is None:
+            existing = config["_dir_contents"][final_dir] = set(os.listdir(final_dir))
+        while True:
+            destination = os.path.join(final_dir, unique_destination(filename, existing))
+            # one lexists call confirms the cached set before rename can
+            # clobber a file someone else placed here since the listing;
+            # the clashing name is now in the set, so the retry moves on
+            if not os.path.lexists(destination):
+                break
 
-    if config.get("dry_run"):
-        logging.info("[DRY RUN] Would move: %s -> %s", file_path, destination)
-    else:
+        if config["dry_run"]:
+            logging.info("[DRY RUN] Would move: %s -> %s", file_path, destination)
+            return
         try:
-            shutil.move(file_path, destination)
+            if st.st_dev == config["_watch_dev"]:
+                # same filesystem: rename(2) is atomic and skips shutil's
+                # Python-level stat/copy branches
+                os.rename(file_path, destination)
+            else:
+                try:
+                    os.rename(file_path, destination)
+                except OSError as e:
+                    if e.errno != errno.EXDEV:
+                        raise
+                    _copy_across_devices(file_path, destination, st)
             logging.info("Moved: %s -> %s", file_path, destination)
         except Exception as e:
             logging.error("Failed to move %s -> %s : %s", file_path, destination, e)
 
+
 # ---------- Watchdog handler ----------
 class OrganizerHandler(FileSystemEventHandler):
-    def __init__(self, config):
+    def __init__(self, config, executor):
         super().__init__()
         self.config = config
+        self.executor = executor
+        # paths already handed to the pool; created/closed/moved events can
+        # all fire for the same file, but it must be processed once
+        self._pending = set()
+        self._pending_lock = threading.Lock()
 
-    def on_created(self, event):
-        # spawn a thread so we don't block the observer
-        if event.is_directory:
+    def _submit(self, path, skip_stability):
+        # events under the folders we organize into are our own moves; one
+        # C-level startswith against the prefix tuple drops them
+        if path.startswith(self.config["_organized_prefixes"]):
             return
-        path = event.src_path
-        # check excludes
-        for pat in self.config.get("exclude_patterns", []):
-            if re.search(pat, os.path.basename(path)):
+        # hand off to the pool, but filter hidden/temp/excluded names first
+        # so they never cost a task submit + stat
+        reason = should_skip(os.path.basename(path), self.config)
+        if reason is not None:
+            if reason == "excluded":
                 logging.info("Excluded by pattern: %s", path)
+            return
+        with self._pending_lock:
+            if path in self._pending:
                 return
-        t = threading.Thread(target=move_file, args=(path, self.config), daemon=True)
-        t.start()
+            self._pending.add(path)
+        future = self.executor.submit(move_file, path, self.config,
+                                      skip_stability=skip_stability)
+        future.add_done_callback(lambda _f: self._pending.discard(path))
+
+    def on_created(self, event):
+        # a close-write may still follow, so poll for stability here; files
+        # moved in from elsewhere produce only this event
+        if not event.is_directory:
+            self._submit(event.src_path, skip_stability=False)
+
+    def on_closed(self, event):
+        # inotify IN_CLOSE_WRITE: the writer is done, no stability polling needed
+        if not event.is_directory:
+            self._submit(event.src_path, skip_stability=True)
+
+    def on_moved(self, event):
+        # a rename into place (e.g. browser finishing a .part download) means
+        # the file is complete
+        if not event.is_directory:
+            self._submit(event.dest_path, skip_stability=True)
 
 # ---------- Main ----------
+def _collect_candidates(dirpath, config, pairs, top_level):
+    """Gather (path, stat) pairs via os.scandir; DirEntry carries stat info
+    without the extra per-entry syscalls os.walk pays."""
+    recursive = config["recursive"]
+    with os.scandir(dirpath) as it:
+        for entry in it:
+            try:
+                if entry.is_file(follow_symlinks=False):
+                    pairs.append((entry.path, entry.stat(follow_symlinks=False)))
+                elif (recursive and entry.is_dir(follow_symlinks=False)
+                      and not (top_level and entry.name in config["_organized_names"])):
+                    # top-level folders we organize into are skipped
+                    _collect_candidates(entry.path, config, pairs, top_level=False)
+            except OSError:
+                # entry vanished between readdir and stat, or the subdir is
+                # unreadable; a live Downloads folder does both
+                continue
+
+# below this many files the per-file loop is cheaper than array setup
+_BULK_CLASSIFY_THRESHOLD = 1000
+
+def _classify_bulk(names, config):
+    """Vectorized extension classification for large one-shot runs: one
+    C-level pass for lowercasing and splitting, and a dict lookup only per
+    unique extension instead of per file."""
+    arr = np.char.lower(np.array(names))
+    parts = np.char.rpartition(arr, ".")
+    uniq, inverse = np.unique(parts[:, 2], return_inverse=True)
+    ext_index = config["_ext_index"]
+    lookup = np.array([ext_index.get("." + e, "Others") for e in uniq], dtype=object)
+    folders = lookup[inverse]
+    folders[parts[:, 1] == ""] = "Others"  # no dot at all
+    for ce in config["_compound_exts"]:
+        folders[np.char.endswith(arr, ce)] = ext_index[ce]
+    return folders
+
 def organize_once(config):
     logging.info("Running one-time organization on %s", config["watch_dir"])
-    for root, dirs, files in os.walk(config["watch_dir"]):
-        for f in files:
-            path = os.path.join(root, f)
-            # skip if file is inside organized subfolders we created
-            rel = os.path.relpath(path, config["watch_dir"])
-            if os.path.sep in rel and rel.split(os.path.sep)[0] in config.get("file_types", {}):
-                # it is already inside a top-level folder we use; skip
-                continue
-            move_file(path, config)
-        if not config.get("recursive"):
-            break
+    # collect candidates first, then fan out: the files are independent and
+    # most wall time is stability-check sleeps, so a pool overlaps them
+    pairs = []
+    _collect_candidates(config["watch_dir"], config, pairs, top_level=True)
+    # pre-compute the classification plan in one vectorized pass when the
+    # run is big enough to matter; regex rules need per-file scans, so they
+    # keep the plain path
+    targets = None
+    if (NUMPY_AVAILABLE and not config["regex_rules"]
+            and len(pairs) >= _BULK_CLASSIFY_THRESHOLD):
+        targets = _classify_bulk([os.path.basename(p) for p, _ in pairs], config)
+    with ThreadPoolExecutor(max_workers=config["max_workers"]) as ex:
+        if targets is None:
+            for path, st in pairs:
+                ex.submit(move_file, path, config, st)
+        else:
+            for (path, st), folder in zip(pairs, targets):
+                ex.submit(move_file, path, config, st, target_folder=folder)
 
 def monitor_forever(config):
     if not WATCHDOG_AVAILABLE:
         logging.error("watchdog package not available. Install with: pip install watchdog")
         return
-    event_handler = OrganizerHandler(config)
+    # bounded pool instead of one thread per event: the work is I/O-bound
+    # (stat + rename), so a handful of workers is plenty even under bursts
+    executor = ThreadPoolExecutor(max_workers=config.get("max_workers", 8))
+    event_handler = OrganizerHandler(config, executor)
     observer = Observer()
-    observer.schedule(event_handler, config["watch_dir"], recursive=config.get("recursive", False))
+    # subscribe only to the events we act on; on inotify this narrows the
+    # kernel event mask (no IN_MODIFY/IN_OPEN churn during writes) and the
+    # emitter drops everything else before Python dispatch
+    try:
+        from watchdog.events import FileCreatedEvent, FileClosedEvent, FileMovedEvent
+        observer.schedule(event_handler, config["watch_dir"],
+                          recursive=config.get("recursive", False),
+                          event_filter=[FileCreatedEvent, FileClosedEvent, FileMovedEvent])
+    except (ImportError, TypeError):
+        # older watchdog without event_filter support
+        observer.schedule(event_handler, config["watch_dir"], recursive=config.get("recursive", False))
     observer.start()
     logging.info("Monitoring %s (recursive=%s)...", config["watch_dir"], config.get("recursive", False))
     try:
@@ -224,6 +511,11 @@ def monitor_forever(config):
             time.sleep(1)
     except KeyboardInterrupt:
         observer.stop()
+        # wake any worker sleeping in wait_until_stable and drop queued
+        # tasks; the pool's non-daemon threads are joined at exit, so
+        # without this Ctrl-C could hang for the full stability timeout
+        _shutdown.set()
+        executor.shutdown(wait=False, cancel_futures=True)
     observer.join()
 
 def main():
@@ -236,6 +528,8 @@ def main():
     config = load_config(args.config)
     setup_logging(config.get("log_file", "organizer.log"))
     logging.info("Config loaded: %s", args.config)
+    for msg in config["_config_warnings"]:
+        logging.warning(msg)
 
     # validate watch_dir
     watch_dir = os.path.expanduser(config["watch_dir"])
@@ -243,6 +537,10 @@ def main():
         logging.error("Watch directory does not exist: %s", watch_dir)
         return
     config["watch_dir"] = watch_dir
+    # targets live under watch_dir, so same-device moves are the common case
+    config["_watch_dev"] = os.stat(watch_dir).st_dev
+    config["_organized_prefixes"] = tuple(os.path.join(watch_dir, name) + os.sep
+                                          for name in config["_organized_names"])
 
     if args.once:
         organize_once(config)